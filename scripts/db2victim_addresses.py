@@ -2,6 +2,7 @@
 
 import sys
 import sqlite3
+from pathlib import Path
 
 # USAGE: ./generate_victim_addresses.py <path/to/db.sqlite> <path/to/out_directory>
 
@@ -14,31 +15,44 @@ output_directory = str(sys.argv[2])
 db_query_path = "./query.sql"
 output_path = output_directory + "/victim_addresses.txt"
 
-output = open(output_path, "w")
 db_query = open(db_query_path, "r")
 
-db = sqlite3.connect(db_path)
-db.text_factory = lambda b: b.decode(errors = 'ignore')
+# the db is only read, open it read-only and immutable so sqlite skips all locking
+db = sqlite3.connect(Path(db_path).resolve().as_uri() + "?mode=ro&immutable=1", uri=True)
+db.execute("PRAGMA mmap_size=268435456")
+db.execute("PRAGMA cache_size=-65536")
+db.execute("PRAGMA temp_store=MEMORY")
+# only the two text columns are decoded (below), instead of a Python callback per cell
+db.text_factory = bytes
 c = db.cursor()
 q = db_query.read()
 c.execute(q)
-data = c.fetchall()
-
-for row in data:
-    victim = row[0]
-    bit = row[1]
-    sign = "+" if row[2] == 1 else "-"
-    aggrs = row[3]
-    aggr_init = hex(255)
-    #try/except because the db connection reads something weird for 0xff?
-    try:
-        if int(row[4], 16) == 0:
-            aggr_init = hex(0)
-    except Exception:
-        pass
-
-    output.write(victim + " " + str(bit) + " " + sign + " " + aggrs + " " + aggr_init + "\n")
-
-output.close()
+# stream the rows in batches instead of materializing the whole result set
+c.arraysize = 10000
+
+# large write buffer, the output is written in big batches anyway
+with open(output_path, "w", buffering=1024*1024) as output:
+    while True:
+        rows = c.fetchmany()
+        if not rows:
+            break
+
+        buf = []
+        for row in rows:
+            victim = row[0].decode("utf-8", "ignore")
+            bit = row[1]
+            sign = "+" if row[2] == 1 else "-"
+            aggrs = row[3].decode("utf-8", "ignore")
+            aggr_init = hex(255)
+            #try/except because the db connection reads something weird for 0xff?
+            try:
+                if int(row[4], 16) == 0:
+                    aggr_init = hex(0)
+            except Exception:
+                pass
+
+            buf.append(f"{victim} {bit} {sign} {aggrs} {aggr_init}\n")
+        output.write("".join(buf))
+
 c.close()
 db.close()
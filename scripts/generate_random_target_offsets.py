@@ -2,14 +2,19 @@
 
 from elftools.elf.elffile import ELFFile
 from pathlib import Path
+from array import array as typed_array
 from capstone import *
 import numpy as np
 import sys
-from tomlkit import comment, document, table, inline_table, array, dumps
+import os
+from functools import partial
+from itertools import starmap
+from concurrent.futures import ProcessPoolExecutor
 
 # This script generates a random target_offsets.toml file
 # USAGE: ./generate_target_offsets.py <path/to/out_directory> <distribution_type> <number_of_fixed_flips> <total_number_of_flips> <list/of/paths/to/executable>
 # `list/of/paths/to/executable` is a space seperated list of paths, it can be the result of a wildcard expansion
+# The executables are processed in parallel, one process per file
 # Note: number_of_range_targets = total_number_of_targets - number_of_fixed_targets
 # `total_number_of_targets` and `number_of_fixed_targets` can be expressed as absolute values or as percentage of the number of asm instructions, e.g.,
 #    8 12 --> 12 targets in total of which 8 are fixed targets and 4 are range targets
@@ -17,23 +22,16 @@ from tomlkit import comment, document, table, inline_table, array, dumps
 #    8 2% --> 2% * number-of-asm-instructions targets in total of which 8 are fixed targets, the others are range targets
 #    10% 20% --> 20% * number-of-asm-instructions targets in total, 10% * total_number_of_targets are fixed targets, the other are range targets
 
-output_dir = sys.argv[1]
-dist_type = sys.argv[2]
-splits = sys.argv[3]
-tots = sys.argv[4]
-file_paths = sys.argv[5:]
+# toml inline table templates for the entries of the `values` array, filled in with str.format
+FIXED_TARGET = '    {{type = "fixed", offset = {}, bit = {}, sign = "{}"}},'
+RANGE_TARGET = '    {{type = "range", start_offset = {}, range = 4, normal_dest = {}, flipped_dest = {}}},'
 
-for file_path in file_paths:
-    print(file_path)
+# Generates the target_offsets.toml file for a single executable, returns the log messages for that file
+def process_file(file_path, output_dir, splits, tots):
+    log = [file_path]
 
-    doc = document()
-    t = inline_table()
-    t.update({
-        "type": "none",
-        "offset": 0x0
-    })
-    a = array()
-    a.add_line(t)
+    #the entries of the `values` array, written out as toml inline tables at the end
+    a = ['    {type = "none", offset = 0},']
 
     rng = np.random.default_rng()
     file = open(file_path, "rb")
@@ -41,76 +39,81 @@ for file_path in file_paths:
     elf_file = ELFFile(file)
     section = elf_file.get_section_by_name(section_name)
     md = Cs(CS_ARCH_X86, CS_MODE_64)
+    md.detail = False
     section_code = section.data()
-    disasm = [x for x in md.disasm(section_code, 0)] #0 bcs we need offset wrt start of section
+    #only the instruction addresses and sizes are needed, keep them in two flat arrays
+    addrs = typed_array("q")
+    sizes = typed_array("q")
+    for address, size, _, _ in md.disasm_lite(section_code, 0): #0 bcs we need offset wrt start of section
+        addrs.append(address)
+        sizes.append(size)
+    addrs = np.frombuffer(addrs, dtype=np.int64)
+    sizes = np.frombuffer(sizes, dtype=np.int64)
+    n_instr = len(addrs)
     high = section["sh_size"]
     low = 1 #for simplicity, so the "I 0x0" should always be present in the output file
-    print("low = " + str(hex(low)) + ", high = " + str(hex(high)))
-    print("instructions = " + str(len(disasm)))
+    log.append("low = " + str(hex(low)) + ", high = " + str(hex(high)))
+    log.append("instructions = " + str(n_instr))
 
     if tots.endswith("%"):
-        total = int(float(tots[:-1]) * len(disasm) / 100)
+        total = int(float(tots[:-1]) * n_instr / 100)
     else:
         total = int(tots)
     if splits.endswith("%"):
         split = int(float(splits[:-1]) * total / 100)
     else:
         split = int(splits)
-    print("total = " + str(total) + ", fixed = " + str(split) + ", range = " + str(total-split))
-    assert(len(disasm) >= total + 2 * (total - split))
-
-    match dist_type:
-        case "uniform": # [size]
-            dist = rng.permutation(range(1, len(disasm)))
-        #case "binomial": # [p, size]
-        #    dist = rng.binomial(high, float(params[0]), int(params[1]))
-        case other:
-            print("Distribution type not supported")
-            assert(False)
+    log.append("total = " + str(total) + ", fixed = " + str(split) + ", range = " + str(total-split))
+    #when split > total (e.g. `8 2%` on a small section), all split targets are fixed and there are no range targets
+    n_range = max(total - split, 0)
+    n_sel = split + n_range
+    assert split >= 0, f"{file_path}: negative number of fixed targets (fixed = {split}, total = {total})"
+    #`dist` doesn't contain instruction 0, so it only has n_instr - 1 entries
+    assert n_instr - 1 >= n_sel + 2 * n_range, \
+        f"{file_path}: too few instructions ({n_instr}) for fixed = {split}, total = {total}"
+
+    #uniform is the only supported distribution type (checked before the files are processed)
+    dist = rng.permutation(n_instr - 1) + 1
+    #binomial: [p, size]
+    #dist = rng.binomial(high, float(params[0]), int(params[1]))
+
+    #draw all random values at once instead of once per target
+    sel = dist[:n_sel]
+    offsets = addrs[sel] + rng.integers(0, sizes[sel])
+    bits = rng.integers(0, 8, size=split)
+    signs = np.array(["+", "-"])[rng.integers(0, 2, size=split)]
 
     #fixed
-    for i in range(0, split):
-        c = dist[i]
-        instr = disasm[c]
-        d = rng.integers(0, instr.size)
-        t = inline_table()
-        t.update({
-            "type": "fixed",
-            "offset": int(instr.address + d),
-            "bit": int(rng.integers(0, 8)),
-            "sign": ["+", "-"][rng.integers(0,2)]
-        })
-        a.add_line(t)
+    #tolist() converts to python ints once, formatting numpy scalars one by one is slow
+    a.extend(starmap(FIXED_TARGET.format, zip(offsets[:split].tolist(), bits.tolist(), signs.tolist(), strict=True)))
 
     #range
-    tmp = array()
-    for i in range(split, total):
-        c = dist[i]
-        instr = disasm[c]
-        d = rng.integers(0, instr.size)
-        t = inline_table()
-        t.update({
-            "type": "range",
-            "start_offset": int(instr.address + d),
-            "range": 4
-        })
-        tmp.add_line(t)
-
-    for t in tmp:
-        i += 1
-        t.add("normal_dest", disasm[dist[i]].address)
-        i += 1
-        t.add("flipped_dest", disasm[dist[i]].address)
-        a.add_line(t)
+    #the destinations are taken from the instructions following the sampled targets in `dist`
+    normal_dests = addrs[dist[n_sel:n_sel + 2 * n_range:2]]
+    flipped_dests = addrs[dist[n_sel + 1:n_sel + 2 * n_range:2]]
+    a.extend(starmap(RANGE_TARGET.format, zip(offsets[split:].tolist(), normal_dests.tolist(), flipped_dests.tolist(), strict=True)))
 
     #write toml
-    doc.add("sections", [{
-        "name": ".dbl_text",
-        "values": a
-    }])
-
-    with open(output_dir + "/target_offsets_" + Path(file_path).stem.rsplit("_", 1)[0] + ".toml", 'w') as f:
-        f.write(dumps(doc))
+    with open(output_dir + "/target_offsets_" + Path(file_path).stem.rsplit("_", 1)[0] + ".toml", 'w', buffering=1024*1024) as f:
+        f.write('[[sections]]\nname = ".dbl_text"\nvalues = [\n' + "\n".join(a) + "]\n")
 
     file.close()
+    return "\n".join(log)
+
+
+if __name__ == "__main__":
+    output_dir = sys.argv[1]
+    dist_type = sys.argv[2]
+    splits = sys.argv[3]
+    tots = sys.argv[4]
+    file_paths = sys.argv[5:]
+
+    if dist_type != "uniform":
+        print("Distribution type not supported")
+        sys.exit(1)
 
+    #capstone and pyelftools are GIL-bound, so use processes instead of threads
+    work = partial(process_file, output_dir=output_dir, splits=splits, tots=tots)
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        for log in ex.map(work, file_paths):
+            print(log)
@@ -1,7 +1,7 @@
 #!/usr/bin/python3
 
 import sys
-import json
+import ijson
 import re
 from pathlib import Path
 
@@ -14,36 +14,43 @@ from pathlib import Path
 # IMPORTANT!!
 # This script puts all data of all garbage count together, and then it select the ones that occured >=X times!
 
+_VICTIM_RE = re.compile(r"(0x[0-9a-f]+) (\d)([+-]) (\d+)")
+_AGGR_RE = re.compile(r"(0x[0-9a-f]+)\((0x[0f]+)\),(0x[0-9a-f]+)\((0x[0f]+)\)")
+
 path = sys.argv[1]
 threshold = int(sys.argv[2])
 
-file = open(path, "r")
-json_data = json.load(file)
-file.close()
-
-victim_locations = json_data["victims"]
-aggressors = json_data["aggr_patterns"]
-distribution = json_data["distribution"]
+# Stream the json file instead of loading it as a whole, the `distribution` is by far the largest part
+# `victims` and `aggr_patterns` are small, and come before `distribution` in the file
+with open(path, "rb") as file:
+    victim_locations = next(ijson.items(file, "victims"))
+with open(path, "rb") as file:
+    aggressors = next(ijson.items(file, "aggr_patterns"))
 
+# count all victim indices of all garbage counts and experiment rounds while parsing,
+# and select a victim as soon as it reaches the threshold, so the histogram doesn't have to be walked afterwards
 histogram = {}
-
-for x in distribution.values():
-    for y in x:
-        for i in y:
-            histogram[i] = histogram.get(i, 0) + 1
-
-file = open(Path(path).parent / "victim_addresses.txt", "w")
-max = 0
-count = 0
-for k,v in histogram.items():
-    if v > max: max = v
-    if v >= threshold:
-        addr, bit, sign, aggr_idx = re.search(r"(0x[0-9a-f]+) (\d)([+-]) (\d+)", victim_locations[k]).groups()
-        aggr_idx = int(aggr_idx)
-        aggr1, aggr1_init, aggr2, aggr2_init = re.search(r"(0x[0-9a-f]+)\((0x[0f]+)\),(0x[0-9a-f]+)\((0x[0f]+)\)", aggressors[aggr_idx]).groups()
-        assert(aggr1_init == aggr2_init)
-        file.write(addr + " " + bit + " " + sign + " " + aggr1 + "," + aggr2 + " " + aggr1_init + "\n")
-        count += 1
-file.close()
-#print("Max: " + str(max))
-print(str(count))
+selected = []
+reach = max(threshold, 1)
+with open(path, "rb") as file:
+    for prefix, event, value in ijson.parse(file):
+        if event == "number" and prefix.startswith("distribution."):
+            n = histogram.get(value, 0) + 1
+            histogram[value] = n
+            if n == reach:
+                selected.append(value)
+
+# aggr_idx -> (aggrs, aggr_init), victims often share the same aggressor pattern
+aggr_cache = {}
+with open(Path(path).parent / "victim_addresses.txt", "w", buffering=1024*1024) as file:
+    for k in selected:
+        addr, bit, sign, aggr_idx = _VICTIM_RE.match(victim_locations[k]).groups()
+        aggr = aggr_cache.get(aggr_idx)
+        if aggr is None:
+            aggr1, aggr1_init, aggr2, aggr2_init = _AGGR_RE.match(aggressors[int(aggr_idx)]).groups()
+            assert(aggr1_init == aggr2_init)
+            aggr = (aggr1 + "," + aggr2, aggr1_init)
+            aggr_cache[aggr_idx] = aggr
+        file.write(addr + " " + bit + " " + sign + " " + aggr[0] + " " + aggr[1] + "\n")
+#print("Max: " + str(max(histogram.values(), default=0)))
+print(str(len(selected)))
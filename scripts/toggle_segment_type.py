@@ -1,32 +1,49 @@
 #!/usr/bin/python3
 
 # This script toggles the segment type of the segment containing the .dbl_text section between PT_NULL and PT_LOAD
-# USAGE: ./toggle_segment_type.py <path/to/executable>
+# USAGE: ./toggle_segment_type.py <path/to/executable> [segment_index]
+# `segment_index` is optional, pass the (0-based) index of the program header when it is already known to skip the lookup
 
 import sys
+import os
+import struct
 from elftools.elf.elffile import ELFFile
 
+# Elf64_Phdr: p_type, p_flags, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, p_align
+PHDR_FORMAT = "<IIQQQQQQ"
+
 filename = sys.argv[1]
-file = open(filename, "r+b")
+fd = os.open(filename, os.O_RDWR)
+file = open(fd, "rb", closefd=False) #only used by pyelftools to parse the headers
 elf = ELFFile(file)
-section = elf.get_section_by_name(".dbl_text")
-
-for (segment_idx, segment) in enumerate(elf.iter_segments()):
-    if segment.section_in_segment(section): break
 
 ehdr = elf.header
 phoff = ehdr["e_phoff"]
 e_phentsize = ehdr["e_phentsize"]
 e_phnum = ehdr["e_phnum"]
-assert(segment_idx < e_phnum)
+
+if len(sys.argv) > 2:
+    segment_idx = int(sys.argv[2])
+    if not 0 <= segment_idx < e_phnum:
+        print("Segment index " + str(segment_idx) + " out of range, the executable has " + str(e_phnum) + " program headers")
+        sys.exit(1)
+else:
+    # find the segment by address directly in the raw program headers
+    assert(e_phentsize == struct.calcsize(PHDR_FORMAT))
+    section = elf.get_section_by_name(".dbl_text")
+    sh_addr = section["sh_addr"]
+    phdrs = os.pread(fd, e_phnum * e_phentsize, phoff)
+    for (segment_idx, (_, _, _, p_vaddr, _, _, p_memsz, _)) in enumerate(struct.iter_unpack(PHDR_FORMAT, phdrs)):
+        if p_vaddr <= sh_addr < p_vaddr + p_memsz: break
+assert(0 <= segment_idx < e_phnum)
 
 offset = phoff + segment_idx * e_phentsize
-file.seek(offset)
-org = int.from_bytes(file.read(1), "little") #byteorder irrelevant
-new = 0 if org else 1
-file.seek(offset)
-file.write(new.to_bytes(1, "little"))
+org = os.pread(fd, 1, offset)[0] #byteorder irrelevant
+assert(org in (0, 1)) #PT_NULL or PT_LOAD
+new = org ^ 1
+os.pwrite(fd, bytes([new]), offset)
 
 print("Change program header type from " + ("PT_LOAD" if org else "PT_NULL") + " to " + ("PT_LOAD" if new else "PT_NULL"))
 
 file.close()
+os.close(fd)